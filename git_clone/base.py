@@ -1,13 +1,77 @@
 import os
+import re
+import json
+import mmap
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from . import data
-import itertools
-import operator
 from collections import deque, namedtuple
-import string
 
 ## this module has the basic higher-level logic of git-clone using the object database implemented in data.py
 
 
+# a single thread pool shared by the whole write_tree recursion for hashing files concurrently
+# hashlib releases the GIL while hashing and file reads are I/O bound, so threads give a real speedup
+# created lazily so commands that never hash files don't pay for pool startup
+_hash_pool = None
+
+def _get_hash_pool():
+    global _hash_pool
+    if _hash_pool is None:
+        _hash_pool = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4))
+    return _hash_pool
+
+
+# files at or above this size are hashed through an mmap instead of f.read() so we don't
+# materialise the whole file as a bytes object first - hashlib accepts any buffer directly
+_MMAP_THRESHOLD = 1024 * 1024
+
+
+# the stat cache ("index"): maps path -> [mtime_ns, size, oid], persisted as JSON in
+# .git-clone/index - a file whose mtime and size are unchanged since it was last hashed keeps its
+# recorded OID without being read or hashed at all, which covers nearly every file on repeat commits
+_index = None
+
+
+def _load_index():
+    global _index
+    if _index is None:
+        try:
+            with open(f'{data.GIT_DIR}/index') as f:
+                _index = json.load(f)
+        except FileNotFoundError: # no index yet - first write-tree in this repository
+            _index = {}
+    return _index
+
+
+def _save_index():
+    if _index is not None:
+        with open(f'{data.GIT_DIR}/index', "w") as f:
+            json.dump(_index, f)
+
+
+# hashes the contents of a single file into the object database and returns its OID
+# an unchanged stat signature short-circuits to the cached OID; otherwise small files are simply
+# read into memory, while large files are memory-mapped so the hash reads straight from the page
+# cache and peak memory no longer scales with the largest blob
+def _hash_file(path):
+    index = _load_index()
+    st = os.stat(path)
+    cached = index.get(path)
+    if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        return cached[2]
+
+    with open(path, "rb") as f:
+        if st.st_size >= _MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                oid = data.hash_object(mapped)
+        else:
+            oid = data.hash_object(f.read())
+
+    index[path] = [st.st_mtime_ns, st.st_size, oid]
+    return oid
+
+
 # HEAD points to ref/heads/main so that the repository has an initial branch called main
 # otherwise, a fresh git-clone repo would have started in detached HEAD
 def init():
@@ -15,113 +79,217 @@ def init():
     data.update_ref("HEAD", data.RefValue(symbolic=True, value="refs/heads/main"))
 
 # creates a tree object that records the names of entries, their types and the object ID's of these entries
+# the traversal is iterative (explicit stack, no Python frame per directory) and runs in two phases:
+# every directory is scanned and every file hash submitted first, so the pool is saturated before
+# any tree object is assembled, then subtree OIDs are computed bottom-up in post-order
 def write_tree(directory="."):
-    entries = []
-    with os.scandir(directory) as it: # iterate through everything in the given directory (either a file or another directory)
-        for entry in it:
-            full = f'{directory}/{entry.name}'
-            if is_ignored(full):
-                continue
-            
-            # if we see a file in the given directory, we mark its type as "blob" and store its contents in the object database (with hash_object)
-            if entry.is_file(follow_symlinks=False):
-                type_ = "blob"
-                with open(full, "rb") as f:
-                    oid = data.hash_object(f.read())
-            
-            # if we see a directory, we mark its type as "tree" and recurse into that directory by calling write_tree again
-            elif entry.is_dir(follow_symlinks=False):
-                type_ = "tree"
-                oid = write_tree(full)
-            
-            entries.append((entry.name, oid, type_))
-
-
-    # building the tree object string
-    tree = "".join(f'{type_} {oid} {name}\n'
-        for name, oid, type_ in sorted(entries)
-    )
-
-    # store the tree string as a new tree object with type "tree" in .git-clone/objects
-    return data.hash_object(tree.encode(), "tree")
+    pool = _get_hash_pool()
+    index = _load_index() # load the stat cache up front so the pool threads never race to create it
+
+    # phase 1: enumerate all directories depth-first, keeping each directory's entries as three
+    # parallel lists (structure-of-arrays) - sorting later compares plain byte strings, not tuples
+    dir_entries = [] # (path, names, types, refs) with children always listed after their parent
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        names = []
+        types = []
+        refs = [] # a future for blobs, a subdirectory path for trees
+        with os.scandir(current) as it: # iterate through everything in the given directory (either a file or another directory)
+            for entry in it:
+                # any directory we descended into is already known not to be ignored, so only the
+                # leaf name needs checking - no need to build and re-split the full path per entry
+                if entry.name == ".git-clone":
+                    continue
+
+                # if we see a file, we mark its type as "blob" and submit its hashing to the shared
+                # pool - independent files are read and hashed concurrently while we keep scanning
+                # stat-cache hits resolve right here to the recorded OID string: the common
+                # unchanged file costs one stat, with no pool round trip at all
+                if entry.is_file(follow_symlinks=False):
+                    type_ = b"blob"
+                    st = entry.stat(follow_symlinks=False)
+                    cached = index.get(entry.path)
+                    if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+                        ref = cached[2]
+                    else:
+                        ref = pool.submit(_hash_file, entry.path)
+
+                # if we see a directory, we mark its type as "tree" and push it to be scanned in turn
+                elif entry.is_dir(follow_symlinks=False):
+                    type_ = b"tree"
+                    ref = entry.path
+                    stack.append(entry.path)
+
+                # encode the name once at collection time - the sort below then compares bytes
+                # (a plain memcmp) and the final join needs no per-entry encode pass
+                names.append(entry.name.encode())
+                types.append(type_)
+                refs.append(ref)
+        dir_entries.append((current, names, types, refs))
+
+    # phase 2: build tree objects in reverse enumeration order (post-order) - every subdirectory's
+    # OID is already in tree_oids by the time the parent tree that references it is emitted
+    tree_oids = {}
+    for current, names, types, refs in reversed(dir_entries):
+        # sort indices by entry name only, then emit in the permuted order
+        # a blob ref is either a future (hashed by the pool, blocked on exactly once here) or
+        # already the OID string when the stat cache resolved it during the scan
+        order = sorted(range(len(names)), key=names.__getitem__)
+        parts = []
+        for i in order:
+            if types[i] == b"blob":
+                oid = refs[i] if isinstance(refs[i], str) else refs[i].result()
+            else:
+                oid = tree_oids[refs[i]]
+            parts.append(types[i] + b' ' + oid.encode() + b' ' + names[i] + b'\n')
+        tree = b"".join(parts)
+        # store the tree bytes as a new tree object with type "tree" in .git-clone/objects
+        tree_oids[current] = data.hash_object(tree, "tree")
+
+    # persist the stat cache so the next write-tree can skip everything that hasn't changed
+    _save_index()
+
+    return tree_oids[directory]
     
 
-# takes an OID of a tree object, loads it from the object database and yields the raw string values of each entry
-def _iter_tree_entries(oid):
-    if not oid: 
-        return 
+# matches one "<type> <oid> <name>" tree-entry line - kept permissive on the type so a corrupt
+# entry still reaches the unknown-type assert below instead of being silently skipped
+_tree_entry_re = re.compile(rb'(\w+) ([0-9a-f]{40}) ([^\n]+)\n')
 
-    tree = data.get_object(oid, "tree")
-    
-    for entry in tree.decode().splitlines():
-        type_, oid, name = entry.split(" ", 2)
-        yield type_, oid, name
 
-# recursively parse a given tree into a dictonary - returns a dictionary mapping: file paths -> blob object IDs
+# parse a given tree into a dictonary - returns a dictionary mapping: file paths -> blob object IDs
+# subtrees are handled with an explicit stack rather than recursion, and every entry is written into
+# the one shared result dict - no per-subtree dicts, .update() merging or Python call frames per level
+# tree OIDs are content-addressed, so the parsed mapping can be cached like commits are - show/log
+# over history repeatedly ask for the same trees, and only the bytes->dict parse is worth skipping
+@functools.lru_cache(maxsize=8192)
 def get_tree(oid, base_path=""):
     result = {}
-    
-    for type_, oid, name in _iter_tree_entries(oid):
-        assert "/" not in name
-        assert name not in ("..", ".")
-        path = base_path + name
-        if type_ == "blob":
-            result[path] = oid
-        elif type_ == "tree":
-            result.update(get_tree(oid, f'{path}/'))
-        else:
-            assert False, f'Unknown tree entry {type_}'
+    stack = [(oid, base_path)]
+
+    while stack:
+        oid, base_path = stack.pop()
+        if not oid:
+            continue
+
+        # one regex pass over the raw bytes parses every entry in C - no full decode, no
+        # splitlines list and no per-line Python string splitting
+        tree = data.get_object(oid, "tree")
+        for match in _tree_entry_re.finditer(tree):
+            type_, oid, name = match.groups()
+            name = name.decode()
+            assert "/" not in name
+            assert name not in ("..", ".")
+            path = base_path + name
+            if type_ == b"blob":
+                result[path] = oid.decode()
+            elif type_ == b"tree":
+                stack.append((oid.decode(), f'{path}/'))
+            else:
+                assert False, f'Unknown tree entry {type_}'
 
     return result
 
 # uses get_tree to get the file OIDs and writes them into the working directory
 def read_tree(tree_oid):
     _empty_current_directory()
-    for path, oid in get_tree(tree_oid, base_path="./").items():
-        os.makedirs(os.path.dirname(path), exist_ok=True) # ensures the directory structure exists before writing to the file
-        # write the contents of the object into the working directory file
-        with open(path, "wb") as f:
-            f.write(data.get_object(oid))
+
+    # sorting groups paths that share a parent together, and the set remembers directories we've
+    # already ensured exist - makedirs otherwise re-stats every ancestor for every single file
+    created_dirs = set()
+    for path, oid in sorted(get_tree(tree_oid, base_path="./").items()):
+        parent = os.path.dirname(path)
+        if parent not in created_dirs:
+            os.makedirs(parent, exist_ok=True)
+            # makedirs just ensured every missing ancestor as well, so record the whole prefix
+            # chain - a later sibling directory then skips the makedirs call entirely
+            ancestor = parent
+            while ancestor and ancestor not in created_dirs:
+                created_dirs.add(ancestor)
+                ancestor = os.path.dirname(ancestor)
+
+        # write the contents of the object through a raw fd - open/write/close without the
+        # buffered file-object layer, since each blob is written in one shot anyway
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, data.get_object(oid))
+        finally:
+            os.close(fd)
 
 # we want to delete all existing stuff in the working directory before reading so we don't have any old files left around after a "read-tree" command
 # e.g. without this, if we saved tree A with a.txt then saved tree B with a.txt and b.txt and then do "read-tree" A, we would have b.txt left over in the working directory
+# we recurse with os.scandir directly (rather than os.walk) so each entry's type comes from the cached
+# readdir metadata on the DirEntry - this avoids paying an extra stat syscall per file just to re-check its type
 def _empty_current_directory():
-    for root, dirnames, filenames in os.walk(".", topdown=False):
-        
-        # remove all files 
-        for filename in filenames:
-            path = os.path.relpath(f'{root}/{filename}')
-            if is_ignored(path) or not os.path.isfile(path):
-                continue
-            os.remove(path)
-        
-        # remove all directories
-        for dirname in dirnames:
-            path = os.path.relpath(f'{root}/{dirname}')
-            if is_ignored(path):
+    fd = os.open(".", os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        _empty_directory_fd(fd)
+    finally:
+        os.close(fd)
+
+
+# removes everything inside an already-open directory file descriptor
+# passing dir_fd to unlink/rmdir (the unlinkat syscall underneath) means the kernel resolves only the
+# leaf name against the open directory instead of re-walking the whole path for every single removal
+def _empty_directory_fd(dir_fd):
+    with os.scandir(dir_fd) as it:
+        for entry in it:
+            if entry.name == ".git-clone":
                 continue
-            try:
-                os.rmdir(path)
-            except (FileNotFoundError, OSError):
-                pass
+
+            # remove each file by leaf name relative to the open directory
+            if entry.is_file(follow_symlinks=False):
+                os.unlink(entry.name, dir_fd=dir_fd)
+
+            # empty out a subdirectory bottom-up before removing the (now hopefully empty) directory itself
+            elif entry.is_dir(follow_symlinks=False):
+                child_fd = os.open(entry.name, os.O_RDONLY | os.O_DIRECTORY, dir_fd=dir_fd)
+                try:
+                    _empty_directory_fd(child_fd)
+                finally:
+                    os.close(child_fd)
+                try:
+                    os.rmdir(entry.name, dir_fd=dir_fd)
+                except (FileNotFoundError, OSError):
+                    pass
+
+            # anything else (symlinks and the like) fails both no-follow type checks above but
+            # still has to go, just as the old os.path.isfile check removed file symlinks
+            else:
+                os.unlink(entry.name, dir_fd=dir_fd)
 
 
 # takes a messsage for the commit, then calls write_tree() for a snapshot of the current working directory, and builds a commit object (text file in object database)
 def commit(message):
-    commit = f'tree {write_tree()}\n'
-    
+    tree = write_tree()
+
+    # build the commit object straight into a bytearray - hash_object wants bytes anyway, and
+    # appending to a bytearray is guaranteed amortised O(1) unlike repeated str += re-allocation
+    commit = bytearray()
+    commit += b'tree '
+    commit += tree.encode()
+    commit += b'\n'
+
     # here we use the HEAD to link this new commit being created to the previous commit (called "parent commit")
     # the previous commit OID is saved in the "parent" key on the commit object
-    # this means we can retrieve the entire list of commits just by referencing the last commit, 
+    # this means we can retrieve the entire list of commits just by referencing the last commit,
     # as we can start from the HEAD, read the "parent" key on the HEAD commit to get the previous commit and so on - like a linked list
     HEAD = data.get_ref("HEAD").value
     if HEAD:
-        commit += f'parent {HEAD}\n'
+        commit += b'parent '
+        commit += HEAD.encode()
+        commit += b'\n'
+
+    commit += b'\n'
+    commit += message.encode()
+    commit += b'\n'
 
-    commit += '\n'
-    commit += f'{message}\n'
+    oid = data.hash_object(bytes(commit), "commit")
 
-    oid = data.hash_object(commit.encode(), "commit")
+    # record the new commit's ancestry in the commit-graph so later history walks don't need to
+    # read the commit object back at all
+    data.record_commit(oid, HEAD or None, tree)
 
     # update the head to set it to the OID of this current, new commit so that it can be used as the parent for the next commit
     data.update_ref("HEAD", data.RefValue(symbolic=False, value=oid))
@@ -131,25 +299,31 @@ def commit(message):
 
 Commit = namedtuple("Commit", ["tree", "parent", "message"])
 
+# commits are immutable by OID (content-addressed), so parsed commits can be cached freely
+# this saves re-reading and re-parsing the same commit objects when log/k revisit them via several refs
+@functools.lru_cache(maxsize=8192)
 def get_commit(oid):
     parent = None
 
-    # load the commit object from the object database and split it into lines
-    commit = data.get_object(oid, "commit").decode()
-    lines = iter(commit.splitlines())
+    # load the commit object and work on the raw bytes - the blank line separates the headers
+    # from the free-form message, so only the small header section gets parsed line by line
+    raw = data.get_object(oid, "commit")
+    sep = raw.index(b'\n\n')
 
-    for line in itertools.takewhile(operator.truth, lines):
-        key, value = line.split(" ", 1)
+    for line in raw[:sep].split(b'\n'):
+        key, _, value = line.partition(b' ')
         # get the tree OID
-        if key == "tree":
-            tree = value
+        if key == b"tree":
+            tree = value.decode()
         # get the parent commit OID
-        elif key == "parent":
-            parent = value
+        elif key == b"parent":
+            parent = value.decode()
         else:
             assert False, f'Unkown field {key}'
 
-    message = '\n'.join(lines)
+    # decode the message tail in one go instead of decoding the whole object up front
+    # and re-joining its lines (the stored trailing newline is not part of the message)
+    message = raw[sep + 2:].decode().removesuffix('\n')
     return Commit(tree, parent, message)
 
 
@@ -184,14 +358,23 @@ def get_oid(name):
         f'refs/heads/{name}' # .git-clone/refs/heads - for a future change
     ]
 
+    # probe for the candidate's existence without deref, then return its dereferenced value - an
+    # existing ref wins even when it resolves to nothing yet (a fresh repo's HEAD points at a main
+    # branch that has no commits). The second read is served from the ref cache, so no extra open.
     for ref in refs_to_try:
         if data.get_ref(ref, deref=False).value:
             return data.get_ref(ref).value
-        
+
+
     # if the string is exactly 40 characters long and all characters are hex digits, we know the given name was an OID so just return the same OID
-    is_hex = all(c in string.hexdigits for c in name)
-    if len(name) == 40 and is_hex:
-        return name
+    # bytes.fromhex validates the whole string in one C pass, and unlike int(name, 16) it doesn't
+    # accept signs, underscores or an 0x prefix (it does skip spaces, hence the explicit check)
+    if len(name) == 40 and " " not in name:
+        try:
+            bytes.fromhex(name)
+            return name
+        except ValueError:
+            pass
     
     assert False, f'Unknown name {name}'
 
@@ -208,9 +391,14 @@ def iter_commits_and_parents(oids):
         visited.add(oid)
         yield oid
 
-        # for each commit, follow its parent pointer to go back in history
-        commit = get_commit(oid)
-        oids.appendleft(commit.parent)
+        # for each commit, follow its parent pointer to go back in history - the commit-graph has
+        # the pointer as a plain table entry, so only commits predating the graph file need the
+        # full object read and parse
+        entry = data.get_commit_graph_entry(oid)
+        if entry is not None:
+            oids.appendleft(entry[0])
+        else:
+            oids.appendleft(get_commit(oid).parent)
 
 
 # creates a new file in the heads directory that contains the commit OID the branch "name" should point to
@@ -240,5 +428,11 @@ def iter_branch_names():
 def reset(oid):
     data.update_ref("HEAD", data.RefValue(symbolic=False, value=oid))
 
+
+# consolidate all direct loose refs into the packed-refs file - worth running periodically on
+# branchy/taggy repos so listing refs is one read instead of one open per ref
+def pack_refs():
+    data.pack_refs()
+
 def is_ignored(path):
     return ".git-clone" in path.split("/")
\ No newline at end of file
@@ -1,11 +1,6 @@
 import argparse
 import os
 import sys
-import textwrap
-import subprocess
-from . import base
-from . import data
-from . import diff
 
 def main():
     args = parse_args()
@@ -13,6 +8,14 @@ def main():
     # which is then ran below with the parsed arguments
     args.func(args)
 
+
+# argparse "type" converter that resolves a ref name or raw hash to an OID
+# importing base lazily here (and in the handlers below) keeps cold start cheap - commands like
+# init and hash-object never pay for importing base and everything it pulls in
+def oid(name):
+    from . import base
+    return base.get_oid(name)
+
 def parse_args():
     # create the top level parser ("git-clone")
     parser = argparse.ArgumentParser()
@@ -21,204 +24,299 @@ def parse_args():
     commands = parser.add_subparsers(dest="command")
     commands.required = True
 
-    
-    # using get_oid allows us to either give a ref name or raw OID hash on the CLI
-    oid = base.get_oid # reference to the get_oid function stored in "oid"
+    # argparse would happily build every subparser on every invocation, so even "git-clone status"
+    # would pay for constructing commit, checkout, log and friends - instead we peek at the
+    # requested command and only build that one, falling back to building everything for
+    # -h/--help or an unknown command so argparse can still print proper usage and errors
+    builders = {
+        "init": _add_init_parser,
+        "hash-object": _add_hash_object_parser,
+        "cat-file": _add_cat_file_parser,
+        "write-tree": _add_write_tree_parser,
+        "read-tree": _add_read_tree_parser,
+        "commit": _add_commit_parser,
+        "log": _add_log_parser,
+        "checkout": _add_checkout_parser,
+        "tag": _add_tag_parser,
+        "k": _add_k_parser,
+        "branch": _add_branch_parser,
+        "status": _add_status_parser,
+        "reset": _add_reset_parser,
+        "show": _add_show_parser,
+    }
+
+    requested = sys.argv[1] if len(sys.argv) > 1 else None
+    if requested in builders:
+        builders[requested](commands)
+    else:
+        for build in builders.values():
+            build(commands)
+
+    return parser.parse_args() # captures what the user typed
 
-    # define the "init" subcommand ("git-clone init") - create new .git-clone directory
+
+# define the "init" subcommand ("git-clone init") - create new .git-clone directory
+def _add_init_parser(commands):
     init_parser = commands.add_parser("init")
     init_parser.set_defaults(func=init) # when "init" is used, call init function (prints hello world)
 
-    
-    # define the "hash-object" subcommand ("git-clone hash-object <file>") - save object
-    # this command will:
-    # 1. read the file's contents of the file path provided
-    # 2. hash the contents with SHA-1 to create the OID
-    # 3. store the raw contents in ".git-clone/objects/{hash}"
+
+# define the "hash-object" subcommand ("git-clone hash-object <file>") - save object
+# this command will:
+# 1. read the file's contents of the file path provided
+# 2. hash the contents to create the OID
+# 3. store the raw contents in ".git-clone/objects/{hash}"
+def _add_hash_object_parser(commands):
     hash_object_parser = commands.add_parser("hash-object")
     hash_object_parser.set_defaults(func=hash_object)
     hash_object_parser.add_argument("file") # user must provide a file path
 
 
-    # define the "cat-file" subcommand ("git-clone cat-file <oid>")
-    # this command is the opposite of hash-object - it will print an object by its OID 
+# define the "cat-file" subcommand ("git-clone cat-file <oid>")
+# this command is the opposite of hash-object - it will print an object by its OID
+def _add_cat_file_parser(commands):
     cat_file_parser = commands.add_parser("cat-file")
     cat_file_parser.set_defaults(func=cat_file)
     cat_file_parser.add_argument("object", type=oid) # user must provide an object ID
 
 
-    # define the "write-tree" subcommand ("git-clone write-tree") - (tree means directory) 
-    # this command is similar to hash-object, but instead of storing an individual file, this stores a whole directory
+# define the "write-tree" subcommand ("git-clone write-tree") - (tree means directory)
+# this command is similar to hash-object, but instead of storing an individual file, this stores a whole directory
+def _add_write_tree_parser(commands):
     write_tree_parser = commands.add_parser("write-tree")
     write_tree_parser.set_defaults(func=write_tree)
 
 
-    # define the "read-tree" subcommand ("git-clone read-tree <tree_oid>")
-    # this command is the opposite of write-tree, in that it takes an OID of a tree and extracts it to the working directory
-    # i.e. the IOD of the tree gives us a snapshot of the file contents and writes the contents back into the working directory, potentially overriding the current contents
+# define the "read-tree" subcommand ("git-clone read-tree <tree_oid>")
+# this command is the opposite of write-tree, in that it takes an OID of a tree and extracts it to the working directory
+# i.e. the IOD of the tree gives us a snapshot of the file contents and writes the contents back into the working directory, potentially overriding the current contents
+def _add_read_tree_parser(commands):
     read_tree_parser = commands.add_parser("read-tree")
     read_tree_parser.set_defaults(func=read_tree)
     read_tree_parser.add_argument("tree", type=oid)
 
 
-    # define the "commit" subcommand ("git-clone commit -m "<message>"")
-    # this command will create a text file stored in the object database with the type of commit that will store:
-    # 1. a message describing the commit
-    # 2. when the snapshot was created
-    # 3. who created the snapshot
+# define the "commit" subcommand ("git-clone commit -m "<message>"")
+# this command will create a text file stored in the object database with the type of commit that will store:
+# 1. a message describing the commit
+# 2. when the snapshot was created
+# 3. who created the snapshot
+def _add_commit_parser(commands):
     commit_parser = commands.add_parser("commit")
     commit_parser.set_defaults(func=commit)
     commit_parser.add_argument("-m", "--message", required=True)
 
 
-    # define the "log" subcommand ("git-clone log <oid>") - optional OID 
-    # this command will walk the list of all commits and print them - i.e. the entire commit history is returned
+# define the "log" subcommand ("git-clone log <oid>") - optional OID
+# this command will walk the list of all commits and print them - i.e. the entire commit history is returned
+def _add_log_parser(commands):
     log_parser = commands.add_parser("log")
     log_parser.set_defaults(func=log)
     log_parser.add_argument("oid", default="@", type=oid, nargs="?") # default as "@" (HEAD) means we log all commits before HEAD
 
 
-    # define the "checkout" subcommand ("git-clone checkout <commit>")
-    # this command will be given either a branch name, a tag or a raw commit OID 
-    # it will populate the working directory with the contents of that commit
-    # HEAD will be updated such that:
-    #   - if a branch name is given, HEAD becomes a symbolic ref to that branch
-    #   - if a tag or OID is given, HEAD is directly set to that OID (non-symbolic, detached HEAD)
+# define the "checkout" subcommand ("git-clone checkout <commit>")
+# this command will be given either a branch name, a tag or a raw commit OID
+# it will populate the working directory with the contents of that commit
+# HEAD will be updated such that:
+#   - if a branch name is given, HEAD becomes a symbolic ref to that branch
+#   - if a tag or OID is given, HEAD is directly set to that OID (non-symbolic, detached HEAD)
+def _add_checkout_parser(commands):
     checkout_parser = commands.add_parser("checkout")
     checkout_parser.set_defaults(func=checkout)
     checkout_parser.add_argument("commit")
 
 
-    # define the "tag" subcommand ("git-clone tag <name of commit> <commit OID>") - optional commit OID (defaults to HEAD)
-    # this command will associate a name to an OID so we can then use the name rather than the OID
+# define the "tag" subcommand ("git-clone tag <name of commit> <commit OID>") - optional commit OID (defaults to HEAD)
+# this command will associate a name to an OID so we can then use the name rather than the OID
+def _add_tag_parser(commands):
     tag_parser = commands.add_parser("tag")
     tag_parser.set_defaults(func=tag)
     tag_parser.add_argument("name")
     tag_parser.add_argument("oid", default="@", type=oid, nargs="?")
 
 
-    # define the "k" subcommand ("git-clone k")
-    # this command will be a visualisation tool to draw all refs and all the commits pointed by the refs
+# define the "k" subcommand ("git-clone k")
+# this command will be a visualisation tool to draw all refs and all the commits pointed by the refs
+def _add_k_parser(commands):
     k_parser = commands.add_parser("k")
     k_parser.set_defaults(func=k)
 
 
-    # define the "branch" subcommand ("git-clone branch <name of branch> <start point of branch>") - optional name (defaults to listing all branches) and optional start point (defaults to HEAD)
-    # creating a new branch means creating a new file in the refs/heads directory of the given name which will contain the OID of the commit the branch currently points to
+# define the "branch" subcommand ("git-clone branch <name of branch> <start point of branch>") - optional name (defaults to listing all branches) and optional start point (defaults to HEAD)
+# creating a new branch means creating a new file in the refs/heads directory of the given name which will contain the OID of the commit the branch currently points to
+def _add_branch_parser(commands):
     branch_parser = commands.add_parser("branch")
     branch_parser.set_defaults(func=branch)
     branch_parser.add_argument("name", nargs="?")
     branch_parser.add_argument("start_point", default="@", type=oid, nargs="?")
 
 
-    # define the "status" subcommand ("git-clone status")
-    # this command will print useful informations about the current, working directory
+# define the "status" subcommand ("git-clone status")
+# this command will print useful informations about the current, working directory
+def _add_status_parser(commands):
     status_parser = commands.add_parser("status")
     status_parser.set_defaults(func=status)
 
 
-    # define the "reset" subcommand ("git-clone reset <commit OID>")
-    # this command will move HEAD to point at the given commit OID
+# define the "reset" subcommand ("git-clone reset <commit OID>")
+# this command will move HEAD to point at the given commit OID
+def _add_reset_parser(commands):
     reset_parser = commands.add_parser("reset")
     reset_parser.set_defaults(func=reset)
     reset_parser.add_argument("commit", type=oid)
 
 
-    # define the "show" subcommand ("git-clone show <OID>") - optional OID (defaults to HEAD)
-    # this command will print a commit object showing the commit message and the textual diff from the last commit
+# define the "show" subcommand ("git-clone show <OID>") - optional OID (defaults to HEAD)
+# this command will print a commit object showing the commit message and the textual diff from the last commit
+def _add_show_parser(commands):
     show_parser = commands.add_parser("show")
     show_parser.set_defaults(func=show)
     show_parser.add_argument("oid", default="@", type=oid, nargs="?")
 
 
-    return parser.parse_args() # captures what the user typed
-
 # "git-clone init" command creates a new empty repository
 # repo data is stored locally in a subdirectory called .git (or in this case, .git-clone)
 def init(args):
+    from . import base, data
     base.init() 
     print (f'Initialised empty git-clone repository in {os.getcwd()}/{data.GIT_DIR}')
 
 
 def hash_object(args):
+    from . import data
     with open(args.file, "rb") as f: # read the file in binary mode - treat the file as raw bytes rather than text
-        print(data.hash_object(f.read())) # hash the file
+        # memory-map large files so the hasher reads straight from the page cache rather than
+        # through a full f.read() copy; small files keep the plain read
+        if os.fstat(f.fileno()).st_size >= 1024 * 1024:
+            import mmap
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                print(data.hash_object(mapped)) # hash the file
+        else:
+            print(data.hash_object(f.read())) # hash the file
 
 
 def cat_file(args):
+    from . import data
     sys.stdout.flush()
     sys.stdout.buffer.write(data.get_object(args.object, expected=None)) # get the object from the given id
 
 
 def write_tree(args):
+    from . import base
     print(base.write_tree())
 
 
 def read_tree(args):
+    from . import base
     base.read_tree(args.tree)
 
 
 def commit(args):
+    from . import base
     print(base.commit(args.message))
 
 
 def _print_commit(oid, commit, refs=None):
     refs_str = f'({", ".join(refs)})' if refs else ""
-    print(f'commit {oid} {refs_str}\n')
-    print(textwrap.indent(commit.message, "    "))
-    print("")
+    # build one pre-encoded bytes chunk and write it straight to the stdout buffer - no textwrap
+    # pass over the message and no per-print encoding round trip for every commit in a long log
+    # blank message lines stay unindented, matching what textwrap.indent used to produce
+    message = b'\n'.join(
+        b'    ' + line if line.strip() else line
+        for line in commit.message.encode().split(b'\n')
+    )
+    sys.stdout.buffer.write(f'commit {oid} {refs_str}\n\n'.encode() + message + b'\n\n')
 
 
 # starting from the given OID (to start from HEAD, we use default "@"), we parse each commit with get_commit
 # we then print out its OID, message and all the refs that point to that commit
 def log(args):
+    import queue
+    import threading
+    from . import base, data
     refs = {}
     for refname, ref in data.iter_refs():
         refs.setdefault(ref.value, []).append(refname)
-    
-    for oid in base.iter_commits_and_parents({args.oid}):
-        commit = base.get_commit(oid)
+
+    # a background thread walks history and parses commits a few entries ahead of the printing
+    # loop - the object reads release the GIL, so disk latency overlaps the Python-side
+    # formatting instead of strictly alternating with it
+    commits = queue.Queue(maxsize=16)
+
+    def produce():
+        # always terminate the stream - either with the end-of-history sentinel or with the
+        # exception itself, so a failed walk (bad OID, corrupt object) can't leave the printing
+        # loop blocked on the queue forever
+        try:
+            for oid in base.iter_commits_and_parents({args.oid}):
+                commits.put((oid, base.get_commit(oid)))
+        except BaseException as error:
+            commits.put(error)
+        else:
+            commits.put(None) # sentinel - end of history
+
+    threading.Thread(target=produce, daemon=True).start()
+
+    while True:
+        item = commits.get()
+        if item is None:
+            break
+        if isinstance(item, BaseException): # the walk failed - re-raise on the main thread
+            raise item
+        oid, commit = item
 
         _print_commit(oid, commit, refs.get(oid))
 
 
 def checkout(args):
+    from . import base
     base.checkout(args.commit)
 
 
 def tag(args):
+    from . import base
     base.create_tag(args.name, args.oid)
 
 
 def k(args):
-    dot = "digraph commits {\n"
-    
+    import subprocess
+    from . import base, data
+    # collect the DOT fragments in a list and join once at the end - growing a str with +=
+    # re-copies the whole graph text on every append once it gets large
+    parts = ["digraph commits {\n"]
+
     oids = set()
-    
+
     # get every ref and collect the OIDs these refs point to into the oids set
     for ref_name, ref in data.iter_refs(deref=False):
-        dot += f'"{ref_name}" [shape=note]\n'
-        dot += f'"{ref_name}" -> "{ref.value}"\n'
+        parts.append(f'"{ref_name}" [shape=note]\n')
+        parts.append(f'"{ref_name}" -> "{ref.value}"\n')
         if not ref.symbolic:
             oids.add(ref.value)
 
     # traverse all commits reachable from the collected OIDs
     for oid in base.iter_commits_and_parents(oids):
         commit = base.get_commit(oid)
-        dot += f'"{oid}" [shape=box style=filled label="{oid[:10]}"]\n'
+        parts.append(f'"{oid}" [shape=box style=filled label="{oid[:10]}"]\n')
         if commit.parent:
-            dot += f'"{oid}" -> "{commit.parent}"\n'
-    
-    dot += "}"
+            parts.append(f'"{oid}" -> "{commit.parent}"\n')
+
+    parts.append("}")
+    dot = "".join(parts)
     print(dot)
 
+    # write straight into dot's stdin and close it - no communicate() bookkeeping, and graphviz
+    # starts rendering as soon as the pipe fills rather than after a full round trip
     with subprocess.Popen (
         ["dot", "-Tpng", "-o", "graph.png"],
         stdin=subprocess.PIPE) as proc:
-            proc.communicate (dot.encode ())
+            proc.stdin.write(dot.encode())
+            proc.stdin.close()
 
 
 def branch(args):
+    from . import base
     # if we don't give a branch name, we just want to list out all the branches
     if not args.name:
         current = base.get_branch_name()
@@ -232,6 +330,7 @@ def branch(args):
 
 
 def status(args):
+    from . import base
     HEAD = base.get_oid("@")
     branch = base.get_branch_name()
     if branch:
@@ -241,6 +340,7 @@ def status(args):
 
 
 def show(args):
+    from . import base, diff
     if not args.oid:
         return
     
@@ -260,4 +360,5 @@ def show(args):
 
 
 def reset(args):
+    from . import base
     base.reset(args.commit)
\ No newline at end of file
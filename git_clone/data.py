@@ -1,9 +1,17 @@
 import os
+import struct
 import hashlib
+import functools
+import threading
 from collections import namedtuple
 
 GIT_DIR = ".git-clone"
 
+# content-addressing hash - nothing here interoperates with real git, so we are free to use
+# BLAKE2b, which is several times faster than SHA-1 per byte; digest_size=20 keeps the familiar
+# 40-char hex OIDs so the on-disk layout and every OID-handling call site stay unchanged
+HASH_ALGO = "blake2b"
+
 
 # creating a wrapper that gives every ref file a structured meaning
 # a direct ref (e.g. RefValue(symbolic=False, value=784...)) stores a commit OID string (the "value") directly in the ref file
@@ -11,24 +19,166 @@ GIT_DIR = ".git-clone"
 RefValue = namedtuple("RefValue", ["symbolic", "value"])
 
 
+# directories already ensured during this invocation - makedirs re-stats every ancestor on each
+# call, which adds up over many ref writes, so each unique directory is only ensured once
+_created_dirs = set()
+
+
+def _ensure_dir(path):
+    if path not in _created_dirs:
+        os.makedirs(path, exist_ok=True)
+        _created_dirs.add(path)
+
+
 def init():
-    os.makedirs(GIT_DIR, exist_ok=True) # create the ".git-clone" directory for the "init" command
-    os.makedirs(f'{GIT_DIR}/objects', exist_ok=True)
+    _ensure_dir(GIT_DIR) # create the ".git-clone" directory for the "init" command
+    _ensure_dir(f'{GIT_DIR}/objects')
+
+
+# pack-style object storage: every new object is appended to one "objects.pack" file, and
+# "objects.idx" records a text line "oid offset length" per object, loaded once into a dict
+# storing thousands of objects as individual files pays an inode plus directory entry each and an
+# open/read/close per access - the pack needs one shared fd and a single pread per object read
+# the lock serialises appends and the first index load, since write_tree hashes (and therefore
+# stores) files from many threads - reentrant because _append_to_pack re-checks the index under it
+_pack_lock = threading.RLock()
+_pack_index = None
+_pack_append = None
+_idx_append = None
+_pack_read_fd = None
+
+
+# loads objects.idx into the in-memory index the first time any object is stored or read
+# the first load happens under the lock with a re-check (hash pool and diff writer threads get
+# here concurrently), and the dict is only published once fully populated so a concurrent reader
+# can never observe a partial index and wrongly fall through to the loose-object path
+def _load_pack_index():
+    global _pack_index
+    if _pack_index is None:
+        with _pack_lock:
+            if _pack_index is None:
+                index = {}
+                try:
+                    with open(f'{GIT_DIR}/objects.idx') as f:
+                        for line in f:
+                            oid, offset, length = line.split()
+                            index[oid] = (int(offset), int(length))
+                except FileNotFoundError: # no pack yet - fresh repo or one that only has loose objects
+                    pass
+                _pack_index = index
+    return _pack_index
+
+
+# appends one object to the pack and records it in the index (file and in-memory dict)
+def _append_to_pack(oid, header, data):
+    global _pack_append, _idx_append
+    with _pack_lock:
+        index = _load_pack_index()
+        if oid in index: # re-check under the lock - another thread may have stored it meanwhile
+            return
+
+        if _pack_append is None:
+            _pack_append = open(f'{GIT_DIR}/objects.pack', 'ab')
+            _idx_append = open(f'{GIT_DIR}/objects.idx', 'a')
+
+        _pack_append.seek(0, os.SEEK_END)
+        offset = _pack_append.tell()
+        _pack_append.write(header)
+        _pack_append.write(data)
+        _pack_append.flush()
+
+        _idx_append.write(f'{oid} {offset} {_pack_append.tell() - offset}\n')
+        _idx_append.flush()
+        index[oid] = (offset, _pack_append.tell() - offset)
+
+
+# one long-lived read descriptor for the pack - pread is positionless, so concurrent readers share it
+def _get_pack_read_fd():
+    global _pack_read_fd
+    if _pack_read_fd is None:
+        _pack_read_fd = os.open(f'{GIT_DIR}/objects.pack', os.O_RDONLY)
+    return _pack_read_fd
+
+
+# persistent commit-graph cache: one fixed-size binary record per commit, appended whenever a
+# commit is created - ancestry walks can then follow parent pointers straight from this table
+# without reading and parsing the commit objects themselves
+# record layout: 20-byte commit oid, 20-byte parent oid (all zeros for no parent), 20-byte tree oid
+_graph_record = struct.Struct("20s20s20s")
+_commit_graph = None
+
+
+# loads the commit-graph file into a dict mapping oid -> (parent_oid, tree_oid) on first use
+def _load_commit_graph():
+    global _commit_graph
+    if _commit_graph is None:
+        _commit_graph = {}
+        try:
+            with open(f'{GIT_DIR}/commit-graph', "rb") as f:
+                raw = f.read()
+        except FileNotFoundError: # repos from before the graph existed just fall back to get_commit
+            return _commit_graph
+        for oid, parent, tree in _graph_record.iter_unpack(raw):
+            _commit_graph[oid.hex()] = (parent.hex() if parent.strip(b'\x00') else None, tree.hex())
+    return _commit_graph
+
+
+# returns the (parent_oid, tree_oid) recorded for a commit, or None if the commit predates the graph
+def get_commit_graph_entry(oid):
+    return _load_commit_graph().get(oid)
+
+
+# appends one commit's record to the commit-graph file and keeps the in-memory dict in sync
+def record_commit(oid, parent, tree):
+    graph = _load_commit_graph()
+    record = _graph_record.pack(
+        bytes.fromhex(oid),
+        bytes.fromhex(parent) if parent else bytes(20),
+        bytes.fromhex(tree),
+    )
+    with open(f'{GIT_DIR}/commit-graph', "ab") as f:
+        f.write(record)
+    graph[oid] = (parent, tree)
 
 
 # each object will have a type tag, the default being "blob" since by default an object is just a collection of bytes with no further semantic meaning
 def hash_object(data, type_="blob"):
-    obj = type_.encode() + b'\x00' + data # prefix the file data with the type (which is converted into a sequence of bytes with encode()) before hashing and storing
-    oid = hashlib.sha1(obj).hexdigest() # object id is the filename which is the SHA-1 hash of the given data (content-addressable)
-    # store the raw data in ".git-clone/objects/<oid>"
-    with open(f'{GIT_DIR}/objects/{oid}', "wb") as out:
-        out.write(obj)
+    # prefix the file data with the type (which is converted into a sequence of bytes with encode()) before hashing and storing
+    # the header and the payload are fed to the hasher separately, so the payload (which may be a
+    # huge bytes object or an mmap) is never copied into one concatenated object first
+    header = type_.encode() + b'\x00'
+    # OIDs are just content addresses, not a security boundary - usedforsecurity=False lets
+    # Python skip FIPS restrictions and pick the fastest available backend
+    hasher = hashlib.new(HASH_ALGO, digest_size=20, usedforsecurity=False)
+    hasher.update(header)
+    hasher.update(data)
+    oid = hasher.hexdigest() # object id is the hash of the given data (content-addressable)
+
+    # identical content hashes to the same OID, so an index hit (the common case for unchanged
+    # files on repeat commits) skips the store entirely - a dict lookup, not even a syscall
+    if oid not in _load_pack_index():
+        _append_to_pack(oid, header, data)
     return oid # return the object id to be printed in cli.py
 
 
-def get_object(oid, expected="blob"):
+# objects are content-addressed, so the bytes behind an OID can never change - repeated reads of the
+# same object (e.g. shared subtrees while log walks history) are served from this cache instead of disk
+# caching the raw read (keyed by OID only, below the type check) means a cat-file and a typed read
+# of the same object share one cache entry instead of one per (oid, expected) pair
+@functools.lru_cache(maxsize=4096)
+def _read_object(oid):
+    entry = _load_pack_index().get(oid)
+    if entry is not None:
+        offset, length = entry
+        return os.pread(_get_pack_read_fd(), length, offset)
+
+    # fall back to a loose object file for repositories written before the pack existed
     with open(f'{GIT_DIR}/objects/{oid}', "rb") as f:
-        obj = f.read()
+        return f.read()
+
+
+def get_object(oid, expected="blob"):
+    obj = _read_object(oid)
 
     type_, _, content = obj.partition(b'\x00')
     type_ = type_.decode()
@@ -61,27 +211,88 @@ def update_ref(ref, value, deref=True):
         value = value.value
 
     ref_path = f'{GIT_DIR}/{ref}'
-    os.makedirs(os.path.dirname(ref_path), exist_ok=True)
+    _ensure_dir(os.path.dirname(ref_path))
     with open(ref_path, "w") as f:
         f.write(value)
 
+    # the write may have changed what any chain of refs resolves to, so drop all cached resolutions
+    _ref_cache.clear()
+
 
 # reads the value of a ref file (e.g. HEAD, refs/tags/<tag>, refs/heads/<branch>)
 def get_ref(ref, deref=True):
     return _get_ref_internal(ref, deref)[1]
         
 
+# packed refs: a single ".git-clone/packed-refs" file with one "<oid> <refname>" line per ref,
+# loaded once into a dict - listing N packed refs is then one file read instead of N opens
+# loose ref files always take precedence, so update_ref can keep writing those
+_packed_refs = None
+
+
+def _load_packed_refs():
+    global _packed_refs
+    if _packed_refs is None:
+        _packed_refs = {}
+        try:
+            with open(f'{GIT_DIR}/packed-refs') as f:
+                for line in f:
+                    oid, refname = line.strip().split(" ", 1)
+                    _packed_refs[refname] = oid
+        except FileNotFoundError: # nothing packed yet - all refs are loose
+            pass
+    return _packed_refs
+
+
+# consolidates every direct loose ref into packed-refs and removes the loose files
+# symbolic refs (HEAD) stay loose since they are rewritten constantly
+def pack_refs():
+    global _packed_refs
+    packed = dict(_load_packed_refs())
+    loose_paths = []
+
+    for path in _walk_refs(f'{GIT_DIR}/refs'):
+        ref_name = os.path.relpath(path, GIT_DIR)
+        ref_value = get_ref(ref_name, deref=False)
+        if ref_value.value and not ref_value.symbolic:
+            packed[ref_name] = ref_value.value
+            loose_paths.append(path)
+
+    with open(f'{GIT_DIR}/packed-refs', "w") as f:
+        for ref_name, oid in sorted(packed.items()):
+            f.write(f'{oid} {ref_name}\n')
+
+    for path in loose_paths:
+        os.remove(path)
+
+    _packed_refs = packed
+    _ref_cache.clear()
+
+
+# resolved refs cached for one CLI invocation - refs are read-only during a command except through
+# update_ref (which clears this), so e.g. N refs that all chain through HEAD -> refs/heads/main
+# re-open refs/heads/main only once instead of once per ref
+_ref_cache = {}
+
+
 # helper function that resolves a ref to its final direct target
 # - If given a direct ref (file contains an OID), it returns (ref_name, RefValue(symbolic=False, value=<OID>))
 # - If given a symbolic ref (file contains "ref: <other_ref>"), it recursively follows the chain
 #   until it reaches a direct ref, and returns the final ref name and its OID
 def _get_ref_internal(ref, deref):
+    result = _ref_cache.get((ref, deref))
+    if result is not None:
+        return result
+
     ref_path = f'{GIT_DIR}/{ref}'
     value = None
 
     if os.path.isfile(ref_path):
         with open(ref_path) as f:
             value =  f.read().strip()
+    else:
+        # no loose file - the ref may live in packed-refs (packed values are always direct OIDs)
+        value = _load_packed_refs().get(ref)
 
     # if the ref is a symbolic ref, this means it points to another ref instead of a commit OID directly
     # therefore recursively resolve until we reach an OID
@@ -89,17 +300,40 @@ def _get_ref_internal(ref, deref):
     if symbolic:
         value = value.split(":", 1)[1].strip()
         if deref:
-            return _get_ref_internal(value, deref=True)
-    
-    return ref, RefValue(symbolic=symbolic, value=value)
+            result = _get_ref_internal(value, deref=True)
+            _ref_cache[(ref, deref)] = result
+            return result
+
+    result = (ref, RefValue(symbolic=symbolic, value=value))
+    _ref_cache[(ref, deref)] = result
+    return result
+
+
+# walks a refs directory with os.scandir, yielding ref file paths as they are discovered
+# the DirEntry type checks reuse cached readdir metadata, so unlike os.walk there is no extra
+# stat work or per-directory filename list being built
+def _walk_refs(directory):
+    try:
+        it = os.scandir(directory)
+    except FileNotFoundError: # no refs directory yet (fresh repo) means no refs to yield
+        return
+    with it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk_refs(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                yield entry.path
 
 
 # a generator function that will iterate on all available refs
 def iter_refs(prefix="", deref=True):
     refs = ["HEAD"]
-    for root, _, filenames in os.walk(f'{GIT_DIR}/refs/'):
-        root = os.path.relpath(root, GIT_DIR) # make the root path relative to GIT_DIR so we don't get absolute paths
-        refs.extend(f'{root}/{name}' for name in filenames)
+    # make each path relative to GIT_DIR so we don't get absolute paths
+    refs.extend(os.path.relpath(path, GIT_DIR) for path in _walk_refs(f'{GIT_DIR}/refs'))
+
+    # packed refs come last and a loose ref shadows its packed entry, so skip the duplicates
+    seen = set(refs)
+    refs.extend(ref_name for ref_name in _load_packed_refs() if ref_name not in seen)
 
     for ref_name in refs:
         if not ref_name.startswith(prefix):
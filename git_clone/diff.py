@@ -1,46 +1,75 @@
-from collections import defaultdict
-import subprocess
-from tempfile import NamedTemporaryFile as Temp
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from . import data
 
-def compare_trees(*trees): # takes in a variable number of trees which are dictionaries (mapping of file path -> OID)
-    entries = defaultdict(lambda: [None] * len(trees)) # every new entry gets a list with [None, None, ...] - length of list is length of given trees
+# fast path for the common two-tree case - an order-preserving union of the path keys (first-seen
+# order, like the original defaultdict gave) plus one .get per side, with no per-path slot list
+def _compare_two(t_from, t_to):
+    for path in dict.fromkeys(path for tree in (t_from, t_to) for path in tree):
+        yield path, t_from.get(path), t_to.get(path)
+
 
-    # for each tree and each (path, oid) key, value pair (i.e. each file) put the file's OID in the correct slot
-    for i, tree in enumerate(trees):
-        for path, oid in tree.items():
-            entries[path][i] = oid
+def compare_trees(*trees): # takes in a variable number of trees which are dictionaries (mapping of file path -> OID)
+    # build the union of all paths once (dict.fromkeys keeps insertion order), then one .get pass per tree
+    paths = dict.fromkeys(path for tree in trees for path in tree)
 
-    for path, oids in entries.items():
-        yield (path, *oids)
+    for path in paths:
+        yield (path, *(tree.get(path) for tree in trees))
 
 
 def diff_trees(t_from, t_to):
-    output = b""
-    
-    for path, o_from, o_to in compare_trees(t_from, t_to):
-        if o_from != o_to:
-            output += diff_blobs(o_from, o_to, path)
-    
-    return output
+    # collect the changed paths first, then run the per-file diffs concurrently - each diff_blobs
+    # call is dominated by fork/exec and pipe I/O for the external diff binary, which all release
+    # the GIL, so independent files diff in parallel; map keeps the results in path order
+    changed = [(o_from, o_to, path)
+        for path, o_from, o_to in _compare_two(t_from, t_to)
+        if o_from != o_to
+    ]
+    if not changed:
+        return b""
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+        # joining the collected outputs in one go also avoids growing a bytes object per file
+        return b"".join(pool.map(lambda args: diff_blobs(*args), changed))
+
+# writes a blob's content (or nothing, for a missing side) into a pipe fd and closes it
+# runs on its own thread so both pipes stay fed - a single thread could deadlock once one
+# pipe's buffer fills while diff is still draining the other
+def _write_blob(fd, oid):
+    try:
+        if oid:
+            os.write(fd, data.get_object(oid))
+    finally:
+        os.close(fd)
+
 
 # compare the contents of two blobs (files)
+# the blob contents are streamed to diff through pipes named as /dev/fd/<n> instead of being
+# written to temporary files first - no create/write-back/unlink round trip through the filesystem
 def diff_blobs(o_from, o_to, path="blob"):
-    # create 2 temporary files to store the blob contents
-    with Temp() as f_from, Temp() as f_to:
-        # loop twice - 1st iteration looks at: oid=o_from, f=f_from ; 2nd looks at: oid=o_to, f=f_to
-        # i.e. pairing the from and to OID's with their temp file we have just created
-        for oid, f in ((o_from, f_from), (o_to, f_to)): 
-            if oid:
-                f.write(data.get_object(oid))
-                f.flush()
-
-        # call the diff command to display the differences between the two files
+    import subprocess
+    r_from, w_from = os.pipe()
+    r_to, w_to = os.pipe()
+
+    writers = []
+    for write_fd, oid in ((w_from, o_from), (w_to, o_to)):
+        writer = threading.Thread(target=_write_blob, args=(write_fd, oid))
+        writer.start()
+        writers.append(writer)
+
+    try:
+        # call the diff command to display the differences between the two pipes
         with subprocess.Popen(
              ['diff', '--unified', '--show-c-function',
-              '--label', f'a/{path}', f_from.name,
-              '--label', f'b/{path}', f_to.name],
-             stdout=subprocess.PIPE) as proc:
+              '--label', f'a/{path}', f'/dev/fd/{r_from}',
+              '--label', f'b/{path}', f'/dev/fd/{r_to}'],
+             stdout=subprocess.PIPE, pass_fds=(r_from, r_to)) as proc:
              output, _ = proc.communicate()
- 
-        return output
\ No newline at end of file
+    finally:
+        os.close(r_from)
+        os.close(r_to)
+        for writer in writers:
+            writer.join()
+
+    return output
\ No newline at end of file